@@ -1,53 +1,171 @@
 """AWS EC2 MCP server exposing instance management tools."""
 import asyncio
-import json
-import logging
+import itertools
 import os
-from typing import Any, Dict, List, Optional
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
 
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
-from dotenv import load_dotenv
+from botocore.exceptions import ClientError
 
 from mcp.server import Server, ToolError, run
 
-load_dotenv()
-
-logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
-logger = logging.getLogger(__name__)
-
-AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-AWS_PROFILE = os.getenv("AWS_PROFILE")
-
-_session_kwargs: Dict[str, Any] = {"region_name": AWS_REGION}
-if AWS_PROFILE:
-    _session_kwargs["profile_name"] = AWS_PROFILE
-
-session = boto3.Session(**_session_kwargs)
-ec2_client = session.client("ec2")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from aws_common import (  # noqa: E402
+    HEAVY_OFFLOAD,
+    ResponseCache,
+    _call,
+    _chunks,
+    _fetch_pages,
+    _handle_boto_error,
+    _json_content,
+    _message_content,
+    _run_in_process,
+    get_client,
+    run_main,
+    size_default_executor,
+)
 
 server = Server("aws-ec2")
 
-
-def _json_content(data: Any) -> Dict[str, Any]:
-    return {"type": "application/json", "data": data}
-
-
-def _handle_boto_error(error: Exception) -> ToolError:
-    logger.exception("AWS EC2 operation failed: %s", error)
-    if isinstance(error, (ClientError, BotoCoreError)):
-        payload = getattr(error, "response", {"error": str(error)})
-        return ToolError(json.dumps(payload))
-    return ToolError(str(error))
+_STATE_FILTERS = {
+    state: [{"Name": "instance-state-name", "Values": [state]}]
+    for state in ("pending", "running", "stopping", "stopped", "shutting-down", "terminated")
+}
+
+# Resources per CreateTags request; larger tag fan-outs are split and sent concurrently.
+_TAG_RESOURCES_PER_CALL = 20
+
+# Coalescing window for start/stop/reboot/terminate calls; a batch flushes early once it reaches the max size.
+_BATCH_WINDOW_MS = float(os.getenv("MCP_BATCH_WINDOW_MS", "25"))
+_BATCH_MAX_SIZE = 50
+# Error codes that blame particular ids; a batch failing with one of these is retried per id.
+# Anything else (throttling, auth, networking) applies to every caller and is not split.
+_PER_INSTANCE_ERRORS = ("InvalidInstanceID.", "IncorrectInstanceState", "UnsupportedOperation", "OperationNotPermitted")
+
+# Read-only Describe/List results, keyed "<tool>:<args>". Mutating tools evict related keys.
+# Sized for list_instances seeding one describe_instance entry per instance.
+_cache = ResponseCache(maxsize=4096)
+
+
+async def _describe_instances(**kwargs: Any) -> List[Dict[str, Any]]:
+    response = await _call(get_client("ec2").describe_instances, **kwargs)
+    reservations = response.get("Reservations", [])
+    return list(itertools.chain.from_iterable(reservation["Instances"] for reservation in reservations))
+
+
+async def _describe_all_instances(filters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not HEAVY_OFFLOAD:
+        return await _describe_instances(Filters=filters)
+    pages = await _run_in_process(_fetch_pages, "ec2", "describe_instances", "Reservations", {"Filters": filters})
+    return list(itertools.chain.from_iterable(reservation["Instances"] for page in pages for reservation in page))
+
+
+async def _list_and_seed_instances(filters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """List instances and prime ``describe_instance`` entries so list-then-describe costs one round trip."""
+    instances = await _describe_all_instances(filters)
+    for instance in instances:
+        _cache[f"describe_instance:{instance['InstanceId']}"] = [instance]
+    return instances
+
+
+def _invalidate_instances(*instance_ids: str) -> None:
+    """Evict every cached listing plus the cached describes of ``instance_ids``."""
+    _cache.invalidate_prefix("list_instances:")
+    for instance_id in instance_ids:
+        _cache.pop(f"describe_instance:{instance_id}", None)
+
+
+class _Batcher:
+    """Coalesce single-instance state changes into one multi-instance EC2 request.
+
+    Ids submitted within the batch window, or until ``max_batch`` ids are
+    queued, share one API call; the response is routed back to each caller
+    by ``InstanceId``.
+    """
+
+    def __init__(
+        self,
+        action: Callable[[List[str]], Dict[str, Any]],
+        result_key: Optional[str],
+        max_batch: int = _BATCH_MAX_SIZE,
+        window_ms: float = _BATCH_WINDOW_MS,
+    ) -> None:
+        self._action = action
+        self._result_key = result_key
+        self._max_batch = max_batch
+        self._window = window_ms / 1000
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, instance_id: str) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(instance_id, []).append(future)
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: Dict[str, List[asyncio.Future]]) -> None:
+        try:
+            response = await _call(self._action, list(batch))
+        except ClientError as exc:
+            if len(batch) > 1 and exc.response.get("Error", {}).get("Code", "").startswith(_PER_INSTANCE_ERRORS):
+                # A single bad id rejects the whole request; retry one by one so each caller gets its own outcome.
+                await asyncio.gather(*(self._dispatch({instance_id: futures}) for instance_id, futures in batch.items()))
+            else:
+                self._resolve(batch, error=exc)
+            return
+        except Exception as exc:  # noqa: BLE001
+            self._resolve(batch, error=exc)
+            return
+        items = response.get(self._result_key, []) if self._result_key else []
+        self._resolve(batch, items=items)
+
+    @staticmethod
+    def _resolve(
+        batch: Dict[str, List[asyncio.Future]],
+        items: Sequence[Dict[str, Any]] = (),
+        error: Optional[Exception] = None,
+    ) -> None:
+        for instance_id, futures in batch.items():
+            result = [item for item in items if item.get("InstanceId") == instance_id]
+            for future in futures:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+_start_batcher = _Batcher(lambda ids: get_client("ec2").start_instances(InstanceIds=ids), "StartingInstances")
+_stop_batchers = {
+    force: _Batcher(lambda ids, force=force: get_client("ec2").stop_instances(InstanceIds=ids, Force=force), "StoppingInstances")
+    for force in (False, True)
+}
+_reboot_batcher = _Batcher(lambda ids: get_client("ec2").reboot_instances(InstanceIds=ids), None)
+_terminate_batcher = _Batcher(lambda ids: get_client("ec2").terminate_instances(InstanceIds=ids), "TerminatingInstances")
 
 
 @server.tool("list_instances", "List EC2 instances")
 async def list_instances(state: Optional[str] = None) -> List[Dict[str, Any]]:
     try:
-        filters = [{"Name": "instance-state-name", "Values": [state]}] if state else []
-        response = ec2_client.describe_instances(Filters=filters)
-        reservations = response.get("Reservations", [])
-        instances = [instance for reservation in reservations for instance in reservation.get("Instances", [])]
+        filters = (_STATE_FILTERS.get(state) or [{"Name": "instance-state-name", "Values": [state]}]) if state else []
+        instances = await _cache.cached(f"list_instances:{state or ''}", lambda: _list_and_seed_instances(filters))
         return [_json_content(instances)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -56,9 +174,7 @@ async def list_instances(state: Optional[str] = None) -> List[Dict[str, Any]]:
 @server.tool("describe_instance", "Describe an EC2 instance")
 async def describe_instance(instance_id: str) -> List[Dict[str, Any]]:
     try:
-        response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        reservations = response.get("Reservations", [])
-        instances = [instance for reservation in reservations for instance in reservation.get("Instances", [])]
+        instances = await _cache.cached(f"describe_instance:{instance_id}", lambda: _describe_instances(InstanceIds=[instance_id]))
         if not instances:
             raise ToolError(f"Instance {instance_id} not found")
         return [_json_content(instances[0])]
@@ -71,8 +187,9 @@ async def describe_instance(instance_id: str) -> List[Dict[str, Any]]:
 @server.tool("start_instance", "Start an EC2 instance")
 async def start_instance(instance_id: str) -> List[Dict[str, Any]]:
     try:
-        response = ec2_client.start_instances(InstanceIds=[instance_id])
-        return [_json_content(response.get("StartingInstances", []))]
+        starting = await _start_batcher.submit(instance_id)
+        _invalidate_instances(instance_id)
+        return [_json_content(starting)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
@@ -80,8 +197,9 @@ async def start_instance(instance_id: str) -> List[Dict[str, Any]]:
 @server.tool("stop_instance", "Stop an EC2 instance")
 async def stop_instance(instance_id: str, force: bool = False) -> List[Dict[str, Any]]:
     try:
-        response = ec2_client.stop_instances(InstanceIds=[instance_id], Force=force)
-        return [_json_content(response.get("StoppingInstances", []))]
+        stopping = await _stop_batchers[force].submit(instance_id)
+        _invalidate_instances(instance_id)
+        return [_json_content(stopping)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
@@ -89,8 +207,9 @@ async def stop_instance(instance_id: str, force: bool = False) -> List[Dict[str,
 @server.tool("reboot_instance", "Reboot an EC2 instance")
 async def reboot_instance(instance_id: str) -> List[Dict[str, Any]]:
     try:
-        ec2_client.reboot_instances(InstanceIds=[instance_id])
-        return [_json_content({"message": f"Instance {instance_id} rebooted"})]
+        await _reboot_batcher.submit(instance_id)
+        _invalidate_instances(instance_id)
+        return [_message_content(f"Instance {instance_id} rebooted")]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
@@ -98,8 +217,9 @@ async def reboot_instance(instance_id: str) -> List[Dict[str, Any]]:
 @server.tool("terminate_instance", "Terminate an EC2 instance")
 async def terminate_instance(instance_id: str) -> List[Dict[str, Any]]:
     try:
-        response = ec2_client.terminate_instances(InstanceIds=[instance_id])
-        return [_json_content(response.get("TerminatingInstances", []))]
+        terminating = await _terminate_batcher.submit(instance_id)
+        _invalidate_instances(instance_id)
+        return [_json_content(terminating)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
@@ -124,7 +244,8 @@ async def run_instances(image_id: str, instance_type: str, key_name: Optional[st
             params["UserData"] = user_data
         if iam_instance_profile:
             params["IamInstanceProfile"] = {"Name": iam_instance_profile}
-        response = ec2_client.run_instances(**params)
+        response = await _call(get_client("ec2").run_instances, **params)
+        _invalidate_instances()
         return [_json_content(response.get("Instances", []))]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -133,7 +254,14 @@ async def run_instances(image_id: str, instance_type: str, key_name: Optional[st
 @server.tool("create_image", "Create an AMI from an instance")
 async def create_image(instance_id: str, name: str, description: Optional[str] = None, no_reboot: bool = False) -> List[Dict[str, Any]]:
     try:
-        response = ec2_client.create_image(InstanceId=instance_id, Name=name, Description=description, NoReboot=no_reboot)
+        response = await _call(
+            get_client("ec2").create_image,
+            InstanceId=instance_id,
+            Name=name,
+            Description=description,
+            NoReboot=no_reboot,
+        )
+        _invalidate_instances(instance_id)
         return [_json_content({"ImageId": response.get("ImageId")})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -142,15 +270,28 @@ async def create_image(instance_id: str, name: str, description: Optional[str] =
 @server.tool("create_tags", "Apply tags to EC2 resources")
 async def create_tags(resource_ids: List[str], tags: Dict[str, str]) -> List[Dict[str, Any]]:
     try:
-        ec2_client.create_tags(Resources=resource_ids, Tags=[{"Key": key, "Value": value} for key, value in tags.items()])
+        tag_list = [{"Key": key, "Value": value} for key, value in tags.items()]
+        results = await asyncio.gather(
+            *(
+                _call(get_client("ec2").create_tags, Resources=chunk, Tags=tag_list)
+                for chunk in _chunks(resource_ids, _TAG_RESOURCES_PER_CALL)
+            ),
+            return_exceptions=True,
+        )
+        # Chunks that succeeded changed their resources even if another failed, so evict before reporting.
+        _invalidate_instances(*resource_ids)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
         return [_json_content({"message": "Tags applied", "resources": resource_ids})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
 
 async def main() -> None:
+    size_default_executor()
     await run(server)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main())
@@ -0,0 +1,83 @@
+"""Tests for the EC2 server's start/stop/reboot/terminate request batcher."""
+import asyncio
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+_SERVER_PATH = Path(__file__).resolve().parent.parent / "server.py"
+
+
+@pytest.fixture(scope="module")
+def server():
+    spec = importlib.util.spec_from_file_location("aws_ec2_server", _SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def ec2(server, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    client = server.get_client("ec2")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def _starting(instance_id):
+    return {"InstanceId": instance_id, "CurrentState": {"Code": 0, "Name": "pending"}, "PreviousState": {"Code": 80, "Name": "stopped"}}
+
+
+def _run(server, client, *instance_ids):
+    """Submit ``instance_ids`` concurrently to a fresh start batcher; return each caller's result or error."""
+    batcher = server._Batcher(lambda ids: client.start_instances(InstanceIds=ids), "StartingInstances")
+
+    async def main():
+        # One worker thread keeps the order of split retries, and so of the stubbed responses, deterministic.
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        return await asyncio.gather(*(batcher.submit(instance_id) for instance_id in instance_ids), return_exceptions=True)
+
+    return asyncio.run(main())
+
+
+def test_concurrent_submissions_share_one_request(server, ec2):
+    client, stubber = ec2
+    stubber.add_response(
+        "start_instances",
+        {"StartingInstances": [_starting("i-1"), _starting("i-2")]},
+        {"InstanceIds": ["i-1", "i-2"]},
+    )
+
+    first, second, repeat = _run(server, client, "i-1", "i-2", "i-1")
+
+    assert first == [_starting("i-1")]
+    assert second == [_starting("i-2")]
+    assert repeat == [_starting("i-1")]
+
+
+def test_bad_id_is_split_out_and_only_fails_its_caller(server, ec2):
+    client, stubber = ec2
+    stubber.add_client_error("start_instances", "InvalidInstanceID.NotFound", expected_params={"InstanceIds": ["i-1", "i-bad"]})
+    stubber.add_response("start_instances", {"StartingInstances": [_starting("i-1")]}, {"InstanceIds": ["i-1"]})
+    stubber.add_client_error("start_instances", "InvalidInstanceID.NotFound", expected_params={"InstanceIds": ["i-bad"]})
+
+    good, bad = _run(server, client, "i-1", "i-bad")
+
+    assert good == [_starting("i-1")]
+    assert isinstance(bad, ClientError)
+    assert bad.response["Error"]["Code"] == "InvalidInstanceID.NotFound"
+
+
+def test_throttling_fails_the_whole_batch_without_splitting(server, ec2):
+    client, stubber = ec2
+    stubber.add_client_error("start_instances", "RequestLimitExceeded", expected_params={"InstanceIds": ["i-1", "i-2"]})
+
+    results = _run(server, client, "i-1", "i-2")
+
+    # A split would have hit the exhausted stubber and surfaced a different error.
+    assert [result.response["Error"]["Code"] for result in results] == ["RequestLimitExceeded", "RequestLimitExceeded"]
@@ -0,0 +1,40 @@
+"""Tests for the shared EC2 client the server gets from aws_common."""
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+import aws_common  # noqa: E402
+
+
+@pytest.fixture
+def fresh_clients(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(aws_common, "_session", None)
+    monkeypatch.setattr(aws_common, "_clients", {})
+
+
+def test_default_region_calls_share_one_client(fresh_clients):
+    assert aws_common.get_client("ec2") is aws_common.get_client("ec2")
+    assert aws_common.get_client("ec2") is aws_common.get_client("ec2", None)
+
+
+def test_concurrent_first_calls_build_a_single_client(fresh_clients):
+    barrier = threading.Barrier(16)
+    clients = []
+
+    def first_call():
+        barrier.wait()
+        clients.append(aws_common.get_client("ec2"))
+
+    threads = [threading.Thread(target=first_call) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(clients) == 16
+    assert all(client is clients[0] for client in clients)
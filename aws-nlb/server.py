@@ -1,51 +1,52 @@
 """AWS Network Load Balancer MCP server."""
-import asyncio
-import json
-import logging
-import os
+import sys
+from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
-from dotenv import load_dotenv
 
 from mcp.server import Server, ToolError, run
 
-load_dotenv()
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from aws_common import ResponseCache, _call, _handle_boto_error, _json_content, get_client, run_main, size_default_executor  # noqa: E402
 
-logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
-logger = logging.getLogger(__name__)
+server = Server("aws-nlb")
 
-AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-AWS_PROFILE = os.getenv("AWS_PROFILE")
+# Read-only Describe/List results, keyed "<tool>:<args>". Mutating tools evict related keys.
+_cache = ResponseCache()
 
-_session_kwargs: Dict[str, Any] = {"region_name": AWS_REGION}
-if AWS_PROFILE:
-    _session_kwargs["profile_name"] = AWS_PROFILE
 
-session = boto3.Session(**_session_kwargs)
-elbv2_client = session.client("elbv2")
+async def _fetch_load_balancers(**kwargs: Any) -> List[Dict[str, Any]]:
+    response = await _call(get_client("elbv2").describe_load_balancers, **kwargs)
+    return response.get("LoadBalancers", [])
 
-server = Server("aws-nlb")
+
+def _search_pages(operation: str, expression: str, **kwargs: Any) -> List[Dict[str, Any]]:
+    paginator = get_client("elbv2").get_paginator(operation)
+    return [item for item in paginator.paginate(**kwargs).search(expression) if item is not None]
+
+
+async def _fetch_network_load_balancers() -> List[Dict[str, Any]]:
+    return await _call(_search_pages, "describe_load_balancers", "LoadBalancers[?Type=='network']")
 
 
-def _json_content(data: Any) -> Dict[str, Any]:
-    return {"type": "application/json", "data": data}
+async def _fetch_target_groups(**kwargs: Any) -> List[Dict[str, Any]]:
+    return await _call(_search_pages, "describe_target_groups", "TargetGroups[?contains(['TCP', 'TLS', 'UDP', 'TCP_UDP'], Protocol)]", **kwargs)
 
 
-def _handle_boto_error(error: Exception) -> ToolError:
-    logger.exception("AWS NLB operation failed: %s", error)
-    if isinstance(error, (ClientError, BotoCoreError)):
-        payload = getattr(error, "response", {"error": str(error)})
-        return ToolError(json.dumps(payload))
-    return ToolError(str(error))
+async def _fetch_listeners(load_balancer_arn: str) -> List[Dict[str, Any]]:
+    response = await _call(get_client("elbv2").describe_listeners, LoadBalancerArn=load_balancer_arn)
+    return response.get("Listeners", [])
+
+
+def _listener_load_balancer_arn(listener_arn: str) -> str:
+    """Derive the owning load balancer ARN (``.../loadbalancer/net/<name>/<id>``) from a listener ARN."""
+    return listener_arn.replace(":listener/", ":loadbalancer/", 1).rsplit("/", 1)[0]
 
 
 @server.tool("list_load_balancers", "List Network Load Balancers")
 async def list_load_balancers() -> List[Dict[str, Any]]:
     try:
-        response = elbv2_client.describe_load_balancers()
-        nlbs = [lb for lb in response.get("LoadBalancers", []) if lb.get("Type") == "network"]
+        nlbs = await _cache.cached("list_load_balancers:", _fetch_network_load_balancers)
         return [_json_content(nlbs)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -54,8 +55,7 @@ async def list_load_balancers() -> List[Dict[str, Any]]:
 @server.tool("describe_load_balancer", "Describe a Network Load Balancer")
 async def describe_load_balancer(load_balancer_arn: str) -> List[Dict[str, Any]]:
     try:
-        response = elbv2_client.describe_load_balancers(LoadBalancerArns=[load_balancer_arn])
-        load_balancers = response.get("LoadBalancers", [])
+        load_balancers = await _cache.cached(f"describe_load_balancer:{load_balancer_arn}", lambda: _fetch_load_balancers(LoadBalancerArns=[load_balancer_arn]))
         if not load_balancers:
             raise ToolError(f"Load balancer {load_balancer_arn} not found")
         return [_json_content(load_balancers[0])]
@@ -75,7 +75,8 @@ async def create_load_balancer(name: str, subnets: List[str], scheme: str = "int
             "Type": type_,
             "IpAddressType": ip_address_type,
         }
-        response = elbv2_client.create_load_balancer(**params)
+        response = await _call(get_client("elbv2").create_load_balancer, **params)
+        _cache.invalidate_prefix("list_load_balancers:")
         return [_json_content(response.get("LoadBalancers", []))]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -84,7 +85,8 @@ async def create_load_balancer(name: str, subnets: List[str], scheme: str = "int
 @server.tool("delete_load_balancer", "Delete a Network Load Balancer")
 async def delete_load_balancer(load_balancer_arn: str) -> List[Dict[str, Any]]:
     try:
-        response = elbv2_client.delete_load_balancer(LoadBalancerArn=load_balancer_arn)
+        response = await _call(get_client("elbv2").delete_load_balancer, LoadBalancerArn=load_balancer_arn)
+        _cache.invalidate_prefix("list_load_balancers:", "describe_load_balancer:", "list_target_groups:", "list_listeners:")
         return [_json_content(response or {"message": f"Load balancer {load_balancer_arn} deletion initiated"})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -94,7 +96,7 @@ async def delete_load_balancer(load_balancer_arn: str) -> List[Dict[str, Any]]:
 async def modify_load_balancer_attributes(load_balancer_arn: str, attributes: Dict[str, str]) -> List[Dict[str, Any]]:
     try:
         attr_list = [{"Key": key, "Value": value} for key, value in attributes.items()]
-        response = elbv2_client.modify_load_balancer_attributes(LoadBalancerArn=load_balancer_arn, Attributes=attr_list)
+        response = await _call(get_client("elbv2").modify_load_balancer_attributes, LoadBalancerArn=load_balancer_arn, Attributes=attr_list)
         return [_json_content(response.get("Attributes", []))]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -104,8 +106,7 @@ async def modify_load_balancer_attributes(load_balancer_arn: str, attributes: Di
 async def list_target_groups(load_balancer_arn: Optional[str] = None) -> List[Dict[str, Any]]:
     try:
         params = {"LoadBalancerArn": load_balancer_arn} if load_balancer_arn else {}
-        response = elbv2_client.describe_target_groups(**params)
-        target_groups = [tg for tg in response.get("TargetGroups", []) if tg.get("Protocol", "").upper() in {"TCP", "TLS", "UDP", "TCP_UDP"}]
+        target_groups = await _cache.cached(f"list_target_groups:{load_balancer_arn or ''}", lambda: _fetch_target_groups(**params))
         return [_json_content(target_groups)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -125,7 +126,8 @@ async def create_target_group(name: str, protocol: str, port: int, vpc_id: str,
             params["HealthCheckProtocol"] = health_check_protocol
         if health_check_port:
             params["HealthCheckPort"] = health_check_port
-        response = elbv2_client.create_target_group(**params)
+        response = await _call(get_client("elbv2").create_target_group, **params)
+        _cache.invalidate_prefix("list_target_groups:")
         return [_json_content(response.get("TargetGroups", []))]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -134,7 +136,8 @@ async def create_target_group(name: str, protocol: str, port: int, vpc_id: str,
 @server.tool("delete_target_group", "Delete an NLB target group")
 async def delete_target_group(target_group_arn: str) -> List[Dict[str, Any]]:
     try:
-        response = elbv2_client.delete_target_group(TargetGroupArn=target_group_arn)
+        response = await _call(get_client("elbv2").delete_target_group, TargetGroupArn=target_group_arn)
+        _cache.invalidate_prefix("list_target_groups:")
         return [_json_content(response or {"message": f"Target group {target_group_arn} deletion initiated"})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -143,7 +146,7 @@ async def delete_target_group(target_group_arn: str) -> List[Dict[str, Any]]:
 @server.tool("register_targets", "Register targets with an NLB target group")
 async def register_targets(target_group_arn: str, targets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     try:
-        response = elbv2_client.register_targets(TargetGroupArn=target_group_arn, Targets=targets)
+        response = await _call(get_client("elbv2").register_targets, TargetGroupArn=target_group_arn, Targets=targets)
         return [_json_content(response or {"message": "Targets registration initiated"})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -152,7 +155,7 @@ async def register_targets(target_group_arn: str, targets: List[Dict[str, Any]])
 @server.tool("deregister_targets", "Deregister targets from an NLB target group")
 async def deregister_targets(target_group_arn: str, targets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     try:
-        response = elbv2_client.deregister_targets(TargetGroupArn=target_group_arn, Targets=targets)
+        response = await _call(get_client("elbv2").deregister_targets, TargetGroupArn=target_group_arn, Targets=targets)
         return [_json_content(response or {"message": "Targets deregistration initiated"})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -161,8 +164,8 @@ async def deregister_targets(target_group_arn: str, targets: List[Dict[str, Any]
 @server.tool("list_listeners", "List listeners for a Network Load Balancer")
 async def list_listeners(load_balancer_arn: str) -> List[Dict[str, Any]]:
     try:
-        response = elbv2_client.describe_listeners(LoadBalancerArn=load_balancer_arn)
-        return [_json_content(response.get("Listeners", []))]
+        listeners = await _cache.cached(f"list_listeners:{load_balancer_arn}", lambda: _fetch_listeners(load_balancer_arn))
+        return [_json_content(listeners)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
@@ -176,7 +179,9 @@ async def create_listener(load_balancer_arn: str, protocol: str, port: int, defa
             "Port": port,
             "DefaultActions": default_actions,
         }
-        response = elbv2_client.create_listener(**params)
+        response = await _call(get_client("elbv2").create_listener, **params)
+        _cache.pop(f"list_listeners:{load_balancer_arn}", None)
+        _cache.invalidate_prefix("list_target_groups:")
         return [_json_content(response.get("Listeners", []))]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -185,7 +190,9 @@ async def create_listener(load_balancer_arn: str, protocol: str, port: int, defa
 @server.tool("delete_listener", "Delete an NLB listener")
 async def delete_listener(listener_arn: str) -> List[Dict[str, Any]]:
     try:
-        response = elbv2_client.delete_listener(ListenerArn=listener_arn)
+        response = await _call(get_client("elbv2").delete_listener, ListenerArn=listener_arn)
+        _cache.pop(f"list_listeners:{_listener_load_balancer_arn(listener_arn)}", None)
+        _cache.invalidate_prefix("list_target_groups:")
         return [_json_content(response or {"message": f"Listener {listener_arn} deletion initiated"})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -201,15 +208,19 @@ async def modify_listener(listener_arn: str, default_actions: Optional[List[Dict
             params["Port"] = port
         if protocol is not None:
             params["Protocol"] = protocol
-        response = elbv2_client.modify_listener(**params)
+        response = await _call(get_client("elbv2").modify_listener, **params)
+        _cache.pop(f"list_listeners:{_listener_load_balancer_arn(listener_arn)}", None)
+        if default_actions is not None:
+            _cache.invalidate_prefix("list_target_groups:")
         return [_json_content(response.get("Listeners", []))]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
 
 async def main() -> None:
+    size_default_executor()
     await run(server)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main())
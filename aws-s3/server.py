@@ -1,53 +1,90 @@
 """AWS S3 MCP server exposing S3 management tools."""
 import asyncio
 import base64
-import json
-import logging
-import os
+import binascii
+import contextlib
+import functools
+import sys
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
-from dotenv import load_dotenv
+from botocore.exceptions import ClientError
 
 from mcp.server import Server, ToolError, run
 
-load_dotenv()
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from aws_common import AWS_REGION, HEAVY_OFFLOAD, ResponseCache, _call, _fetch_pages, _handle_boto_error, _json_content, _loads, _message_content, _run_in_process, get_client, run_main, size_default_executor  # noqa: E402
 
-logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
-logger = logging.getLogger(__name__)
+server = Server("aws-s3")
 
-AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-AWS_PROFILE = os.getenv("AWS_PROFILE")
+# Read-only Describe/List results, keyed "<tool>:<args>". Mutating tools evict related keys.
+_cache = ResponseCache()
 
-_session_kwargs: Dict[str, Any] = {"region_name": AWS_REGION}
-if AWS_PROFILE:
-    _session_kwargs["profile_name"] = AWS_PROFILE
+_LIST_PAGE_SIZE = 1000
+# Concurrent prefix scans per listing; kept below the client's connection pool size.
+_LIST_CONCURRENCY = 20
+# Fan out only over a handful of prefixes per scan slot; past this, one LIST walk per prefix costs
+# more requests than a single sequential walk of the whole prefix.
+_LIST_FANOUT_MAX_PREFIXES = 4 * _LIST_CONCURRENCY
 
-session = boto3.Session(**_session_kwargs)
-s3_client = session.client("s3")
 
-server = Server("aws-s3")
+@functools.lru_cache(maxsize=None)
+def _transfer_config() -> Any:
+    # Imported here so boto3 loads on the first transfer rather than at startup.
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=10, use_threads=True)
+
+
+async def _iter_pages(paginator: Any, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+    """Yield paginator pages one at a time, fetching each on a worker thread."""
+    pages = iter(paginator.paginate(**kwargs))
+    while (page := await _call(next, pages, None)) is not None:
+        yield page
+
+
+async def _collect_pages(paginator: Any, semaphore: Optional[asyncio.Semaphore] = None, **kwargs: Any) -> List[List[Dict[str, Any]]]:
+    async with semaphore or contextlib.nullcontext():
+        return [page.get("Contents", []) async for page in _iter_pages(paginator, **kwargs)]
+
+
+async def _scan_prefix(paginator: Any, semaphore: asyncio.Semaphore, bucket_name: str, prefix: str) -> List[List[Dict[str, Any]]]:
+    params = {"Bucket": bucket_name, "Prefix": prefix, "PaginationConfig": {"PageSize": _LIST_PAGE_SIZE}}
+    if not HEAVY_OFFLOAD:
+        return await _collect_pages(paginator, semaphore, **params)
+    async with semaphore:
+        return await _run_in_process(_fetch_pages, "s3", "list_objects_v2", "Contents", params)
 
 
-def _json_content(data: Any) -> Dict[str, Any]:
-    return {"type": "application/json", "data": data}
+def _decode_content(content: str, is_base64: bool) -> bytes:
+    return base64.b64decode(content) if is_base64 else content.encode("utf-8")
 
 
-def _handle_boto_error(error: Exception) -> ToolError:
-    logger.exception("AWS S3 operation failed: %s", error)
-    message = str(error)
-    if isinstance(error, (ClientError, BotoCoreError)):
-        message = json.dumps(error.response if hasattr(error, "response") else {"error": str(error)})
-    return ToolError(message)
+def _upload_file(source: Path, bucket_name: str, object_key: str) -> None:
+    with open(source, "rb") as file_handle:
+        get_client("s3").upload_fileobj(file_handle, bucket_name, object_key, Config=_transfer_config())
+
+
+def _download_file(bucket_name: str, object_key: str, dest: Path) -> None:
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with open(dest, "wb") as file_handle:
+        get_client("s3").download_fileobj(bucket_name, object_key, file_handle, Config=_transfer_config())
+
+
+async def _fetch_buckets() -> List[Dict[str, Any]]:
+    response = await _call(get_client("s3").list_buckets)
+    return response.get("Buckets", [])
+
+
+async def _fetch_bucket_policy(bucket_name: str) -> str:
+    response = await _call(get_client("s3").get_bucket_policy, Bucket=bucket_name)
+    return response.get("Policy") or "{}"
 
 
 @server.tool("list_buckets", "List all S3 buckets in the account")
 async def list_buckets() -> List[Dict[str, Any]]:
     try:
-        response = s3_client.list_buckets()
-        buckets = response.get("Buckets", [])
+        buckets = await _cache.cached("list_buckets:", _fetch_buckets)
         return [_json_content(buckets)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -60,7 +97,8 @@ async def create_bucket(bucket_name: str, region: Optional[str] = None) -> List[
     if target_region != "us-east-1":
         kwargs["CreateBucketConfiguration"] = {"LocationConstraint": target_region}
     try:
-        response = s3_client.create_bucket(**kwargs)
+        response = await _call(get_client("s3").create_bucket, **kwargs)
+        _cache.invalidate_prefix("list_buckets:")
         return [_json_content(response)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -69,20 +107,44 @@ async def create_bucket(bucket_name: str, region: Optional[str] = None) -> List[
 @server.tool("delete_bucket", "Delete an S3 bucket")
 async def delete_bucket(bucket_name: str) -> List[Dict[str, Any]]:
     try:
-        response = s3_client.delete_bucket(Bucket=bucket_name)
+        response = await _call(get_client("s3").delete_bucket, Bucket=bucket_name)
+        _cache.invalidate_prefix("list_buckets:")
+        _cache.pop(f"get_bucket_policy:{bucket_name}", None)
         return [_json_content(response or {"message": "Bucket deletion initiated."})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
 
 @server.tool("list_objects", "List objects within an S3 bucket")
-async def list_objects(bucket_name: str, prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+async def list_objects(bucket_name: str, prefix: Optional[str] = None, max_items: Optional[int] = None) -> List[Dict[str, Any]]:
+    """List objects, returning one content item per page of up to 1000 keys.
+
+    Without ``max_items`` the listing fans out over the top-level common
+    prefixes below ``prefix`` and scans them concurrently, unless there are
+    too many of them, in which case ``prefix`` is walked sequentially.
+    """
     try:
-        paginator = s3_client.get_paginator("list_objects_v2")
-        objects: List[Dict[str, Any]] = []
-        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix or ""):
-            objects.extend(page.get("Contents", []))
-        return [_json_content(objects)]
+        paginator = get_client("s3").get_paginator("list_objects_v2")
+        base_prefix = prefix or ""
+        if max_items is not None:
+            pages = await _collect_pages(paginator, Bucket=bucket_name, Prefix=base_prefix, PaginationConfig={"PageSize": min(_LIST_PAGE_SIZE, max(max_items, 1)), "MaxItems": max_items})
+        else:
+            pages = []
+            sub_prefixes: List[str] = []
+            async for page in _iter_pages(paginator, Bucket=bucket_name, Prefix=base_prefix, Delimiter="/", PaginationConfig={"PageSize": _LIST_PAGE_SIZE}):
+                pages.append(page.get("Contents", []))
+                sub_prefixes.extend(common["Prefix"] for common in page.get("CommonPrefixes", []))
+                if len(sub_prefixes) > _LIST_FANOUT_MAX_PREFIXES:
+                    break
+            semaphore = asyncio.Semaphore(_LIST_CONCURRENCY)
+            if len(sub_prefixes) > _LIST_FANOUT_MAX_PREFIXES:
+                pages = await _scan_prefix(paginator, semaphore, bucket_name, base_prefix)
+            else:
+                scans = await asyncio.gather(*(_scan_prefix(paginator, semaphore, bucket_name, sub_prefix) for sub_prefix in sub_prefixes))
+                for scanned in scans:
+                    pages.extend(scanned)
+        chunks = [_json_content(contents) for contents in pages if contents]
+        return chunks or [_json_content([])]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
@@ -92,15 +154,22 @@ async def upload_object(bucket_name: str, object_key: str, file_path: Optional[s
     """Upload an object to S3 either from a local file or provided content."""
     if not file_path and content is None:
         raise ToolError("Either file_path or content must be provided.")
+    source = Path(file_path).expanduser() if file_path else None
+    if source is not None and not source.is_file():
+        raise ToolError(f"File {source} does not exist.")
 
     try:
-        if file_path:
-            with open(Path(file_path).expanduser(), "rb") as file_handle:
-                s3_client.upload_fileobj(file_handle, bucket_name, object_key)
+        if source is not None:
+            await _call(_upload_file, source, bucket_name, object_key)
         else:
-            data = base64.b64decode(content) if is_base64 else content.encode("utf-8")
-            s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=data)
+            try:
+                data = await _call(_decode_content, content, is_base64)
+            except binascii.Error as exc:
+                raise ToolError(f"content is not valid base64: {exc}") from exc
+            await _call(get_client("s3").put_object, Bucket=bucket_name, Key=object_key, Body=data)
         return [_json_content({"bucket": bucket_name, "key": object_key})]
+    except ToolError:
+        raise
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
@@ -109,9 +178,7 @@ async def upload_object(bucket_name: str, object_key: str, file_path: Optional[s
 async def download_object(bucket_name: str, object_key: str, destination_path: str) -> List[Dict[str, Any]]:
     try:
         dest = Path(destination_path).expanduser()
-        dest.parent.mkdir(parents=True, exist_ok=True)
-        with open(dest, "wb") as file_handle:
-            s3_client.download_fileobj(bucket_name, object_key, file_handle)
+        await _call(_download_file, bucket_name, object_key, dest)
         return [_json_content({"message": f"Object saved to {dest}"})]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -120,21 +187,25 @@ async def download_object(bucket_name: str, object_key: str, destination_path: s
 @server.tool("delete_object", "Delete an object from S3")
 async def delete_object(bucket_name: str, object_key: str) -> List[Dict[str, Any]]:
     try:
-        response = s3_client.delete_object(Bucket=bucket_name, Key=object_key)
+        response = await _call(get_client("s3").delete_object, Bucket=bucket_name, Key=object_key)
         return [_json_content(response)]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
 
 @server.tool("get_bucket_policy", "Retrieve the policy for an S3 bucket")
-async def get_bucket_policy(bucket_name: str) -> List[Dict[str, Any]]:
+async def get_bucket_policy(bucket_name: str, parsed: bool = False) -> List[Dict[str, Any]]:
+    """Return the bucket policy.
+
+    By default ``data`` is the policy document exactly as S3 returned it, an
+    already-encoded JSON string. Pass ``parsed=True`` to receive it as an object.
+    """
     try:
-        response = s3_client.get_bucket_policy(Bucket=bucket_name)
-        policy = json.loads(response.get("Policy", "{}"))
-        return [_json_content(policy)]
+        policy = await _cache.cached(f"get_bucket_policy:{bucket_name}", lambda: _fetch_bucket_policy(bucket_name))
+        return [_json_content(_loads(policy) if parsed else policy)]
     except ClientError as exc:
         if exc.response["Error"].get("Code") == "NoSuchBucketPolicy":
-            return [_json_content({"message": "Bucket policy not found"})]
+            return [_message_content("Bucket policy not found")]
         raise _handle_boto_error(exc)
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
@@ -143,15 +214,17 @@ async def get_bucket_policy(bucket_name: str) -> List[Dict[str, Any]]:
 @server.tool("set_bucket_policy", "Set the policy for an S3 bucket")
 async def set_bucket_policy(bucket_name: str, policy_json: str) -> List[Dict[str, Any]]:
     try:
-        s3_client.put_bucket_policy(Bucket=bucket_name, Policy=policy_json)
-        return [_json_content({"message": "Bucket policy updated"})]
+        await _call(get_client("s3").put_bucket_policy, Bucket=bucket_name, Policy=policy_json)
+        _cache.pop(f"get_bucket_policy:{bucket_name}", None)
+        return [_message_content("Bucket policy updated")]
     except Exception as exc:  # noqa: BLE001
         raise _handle_boto_error(exc)
 
 
 async def main() -> None:
+    size_default_executor()
     await run(server)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main())
@@ -0,0 +1,56 @@
+"""Tests for the S3 server's prefix fan-out in list_objects."""
+import asyncio
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from botocore.stub import Stubber
+
+_SERVER_PATH = Path(__file__).resolve().parent.parent / "server.py"
+
+
+@pytest.fixture
+def server():
+    spec = importlib.util.spec_from_file_location("aws_s3_server", _SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def stubber(server, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with Stubber(server.get_client("s3")) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def _list(server, **kwargs):
+    async def main():
+        # One worker thread keeps the order of concurrent scans, and so of the stubbed responses, deterministic.
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        return await server.list_objects("bucket", **kwargs)
+
+    return [content["data"] for content in asyncio.run(main())]
+
+
+def _probe(prefixes, keys=()):
+    return {"Contents": [{"Key": key} for key in keys], "CommonPrefixes": [{"Prefix": prefix} for prefix in prefixes], "IsTruncated": False}
+
+
+def test_few_prefixes_are_scanned_individually(server, stubber):
+    stubber.add_response("list_objects_v2", _probe(["a/", "b/"], ["root"]), {"Bucket": "bucket", "Prefix": "", "Delimiter": "/", "MaxKeys": 1000})
+    for prefix in ("a/", "b/"):
+        stubber.add_response("list_objects_v2", {"Contents": [{"Key": f"{prefix}key"}], "IsTruncated": False}, {"Bucket": "bucket", "Prefix": prefix, "MaxKeys": 1000})
+
+    assert _list(server) == [[{"Key": "root"}], [{"Key": "a/key"}], [{"Key": "b/key"}]]
+
+
+def test_many_prefixes_fall_back_to_one_sequential_walk(server, stubber):
+    prefixes = [f"p{index}/" for index in range(server._LIST_FANOUT_MAX_PREFIXES + 1)]
+    stubber.add_response("list_objects_v2", _probe(prefixes, ["root"]), {"Bucket": "bucket", "Prefix": "", "Delimiter": "/", "MaxKeys": 1000})
+    stubber.add_response("list_objects_v2", {"Contents": [{"Key": "root"}, {"Key": "p0/key"}], "IsTruncated": False}, {"Bucket": "bucket", "Prefix": "", "MaxKeys": 1000})
+
+    assert _list(server) == [[{"Key": "root"}, {"Key": "p0/key"}]]
@@ -1,146 +1,163 @@
 """AWS VPC MCP server exposing VPC management tools."""
 import asyncio
-import json
-import logging
-import os
+import sys
+from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
-from dotenv import load_dotenv
-
 from mcp.server import Server, ToolError, run
 
-load_dotenv()
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from aws_common import ResponseCache, _call, _chunks, _filter, _json_content, _list_items, _paginate, _paginate_regions, aws_tool, get_client, run_main, size_default_executor  # noqa: E402
+
+server = Server("aws-vpc")
 
-logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
-logger = logging.getLogger(__name__)
+_cache = ResponseCache()
 
-AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-AWS_PROFILE = os.getenv("AWS_PROFILE")
+# Largest page EC2 Describe* calls accept, so listings take as few round trips as possible.
+_PAGE_CONFIG = {"PageSize": 1000}
 
-_session_kwargs: Dict[str, Any] = {"region_name": AWS_REGION}
-if AWS_PROFILE:
-    _session_kwargs["profile_name"] = AWS_PROFILE
+# CreateTags accepts at most 1000 resource ids per request.
+_TAG_RESOURCES_PER_CALL = 1000
 
-session = boto3.Session(**_session_kwargs)
-ec2_client = session.client("ec2")
+# Poll every 2s for up to 30s; new VPCs and subnets are normally available within seconds.
+_WAITER_CONFIG = {"Delay": 2, "MaxAttempts": 15}
 
-server = Server("aws-vpc")
+
+async def _wait_for(waiter_name: str, **params: Any) -> None:
+    await _call(get_client("ec2").get_waiter(waiter_name).wait, WaiterConfig=_WAITER_CONFIG, **params)
+
+
+async def _fetch_vpcs() -> List[Dict[str, Any]]:
+    return await _paginate("ec2", "describe_vpcs", "Vpcs", PaginationConfig=_PAGE_CONFIG)
 
 
-def _json_content(data: Any) -> Dict[str, Any]:
-    return {"type": "application/json", "data": data}
+async def _describe_vpcs(**kwargs: Any) -> List[Dict[str, Any]]:
+    response = await _call(get_client("ec2").describe_vpcs, **kwargs)
+    return response.get("Vpcs", [])
 
 
-def _handle_boto_error(error: Exception) -> ToolError:
-    logger.exception("AWS VPC operation failed: %s", error)
-    if isinstance(error, (ClientError, BotoCoreError)):
-        payload = getattr(error, "response", {"error": str(error)})
-        return ToolError(json.dumps(payload))
-    return ToolError(str(error))
+async def _list_and_seed_vpcs() -> List[Dict[str, Any]]:
+    """List VPCs and prime ``describe_vpc`` entries so list-then-describe costs one round trip."""
+    vpcs = await _fetch_vpcs()
+    for vpc in vpcs:
+        _cache[f"describe_vpc:{vpc['VpcId']}"] = [vpc]
+    return vpcs
 
 
-@server.tool("list_vpcs", "List all VPCs")
-async def list_vpcs() -> List[Dict[str, Any]]:
-    try:
-        response = ec2_client.describe_vpcs()
-        return [_json_content(response.get("Vpcs", []))]
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
+async def _fetch_subnets(vpc_id: Optional[str]) -> List[Dict[str, Any]]:
+    filters = list(_filter("vpc-id", vpc_id)) if vpc_id else []
+    return await _list_items("ec2", "describe_subnets", "Subnets", Filters=filters)
 
 
-@server.tool("describe_vpc", "Describe a specific VPC")
+@aws_tool(server, "list_vpcs", "List all VPCs, optionally across several regions")
+async def list_vpcs(regions: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    if not regions:
+        vpcs = await _cache.cached("list_vpcs:", _list_and_seed_vpcs)
+        return [_json_content(vpcs)]
+    regions = list(dict.fromkeys(regions))
+    by_region = await _cache.cached(
+        f"list_vpcs:{','.join(sorted(regions))}",
+        lambda: _paginate_regions("ec2", "describe_vpcs", "Vpcs", regions, PaginationConfig=_PAGE_CONFIG),
+    )
+    return [_json_content(by_region)]
+
+
+@aws_tool(server, "describe_vpc", "Describe a specific VPC")
 async def describe_vpc(vpc_id: str) -> List[Dict[str, Any]]:
-    try:
-        response = ec2_client.describe_vpcs(VpcIds=[vpc_id])
-        vpcs = response.get("Vpcs", [])
-        if not vpcs:
-            raise ToolError(f"VPC {vpc_id} not found")
-        return [_json_content(vpcs[0])]
-    except ToolError:
-        raise
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
-
-
-@server.tool("create_vpc", "Create a new VPC")
-async def create_vpc(cidr_block: str, ipv6_support: bool = False, instance_tenancy: str = "default") -> List[Dict[str, Any]]:
-    try:
-        response = ec2_client.create_vpc(CidrBlock=cidr_block, InstanceTenancy=instance_tenancy)
-        vpc = response.get("Vpc", {})
-        if ipv6_support:
-            ec2_client.associate_vpc_cidr_block(VpcId=vpc.get("VpcId"), AmazonProvidedIpv6CidrBlock=True)
-        return [_json_content(vpc)]
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
+    vpcs = await _cache.cached(f"describe_vpc:{vpc_id}", lambda: _describe_vpcs(VpcIds=[vpc_id]))
+    if not vpcs:
+        raise ToolError(f"VPC {vpc_id} not found")
+    return [_json_content(vpcs[0])]
 
 
-@server.tool("delete_vpc", "Delete a VPC")
+@aws_tool(server, "create_vpc", "Create a new VPC")
+async def create_vpc(cidr_block: str, ipv6_support: bool = False, instance_tenancy: str = "default") -> List[Dict[str, Any]]:
+    response = await _call(get_client("ec2").create_vpc, CidrBlock=cidr_block, InstanceTenancy=instance_tenancy)
+    vpc = response.get("Vpc", {})
+    _cache.invalidate_prefix("list_vpcs:")
+    if ipv6_support:
+        # The VPC exists from here on; any failure must name it or the caller cannot find it again.
+        try:
+            await _wait_for("vpc_available", VpcIds=[vpc.get("VpcId")])
+            await _call(get_client("ec2").associate_vpc_cidr_block, VpcId=vpc.get("VpcId"), AmazonProvidedIpv6CidrBlock=True)
+        except Exception as exc:  # noqa: BLE001
+            raise ToolError(f"VPC {vpc.get('VpcId')} was created, but associating its IPv6 CIDR block failed: {exc}") from exc
+        _cache.invalidate_prefix("list_vpcs:")
+        _cache.pop(f"describe_vpc:{vpc.get('VpcId')}", None)
+    return [_json_content(vpc)]
+
+
+@aws_tool(server, "delete_vpc", "Delete a VPC")
 async def delete_vpc(vpc_id: str) -> List[Dict[str, Any]]:
-    try:
-        response = ec2_client.delete_vpc(VpcId=vpc_id)
-        return [_json_content(response or {"message": f"VPC {vpc_id} deletion initiated"})]
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
+    response = await _call(get_client("ec2").delete_vpc, VpcId=vpc_id)
+    _cache.invalidate_prefix("list_vpcs:")
+    _cache.pop(f"describe_vpc:{vpc_id}", None)
+    return [_json_content(response or {"message": f"VPC {vpc_id} deletion initiated"})]
 
 
-@server.tool("modify_vpc_attribute", "Modify a VPC attribute")
+@aws_tool(server, "modify_vpc_attribute", "Modify a VPC attribute")
 async def modify_vpc_attribute(vpc_id: str, enable_dns_support: Optional[bool] = None, enable_dns_hostnames: Optional[bool] = None) -> List[Dict[str, Any]]:
-    try:
-        if enable_dns_support is not None:
-            ec2_client.modify_vpc_attribute(VpcId=vpc_id, EnableDnsSupport={"Value": enable_dns_support})
-        if enable_dns_hostnames is not None:
-            ec2_client.modify_vpc_attribute(VpcId=vpc_id, EnableDnsHostnames={"Value": enable_dns_hostnames})
-        return [_json_content({"message": "VPC attributes updated", "vpc_id": vpc_id})]
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
-
-
-@server.tool("list_subnets", "List subnets optionally filtered by VPC")
+    # ModifyVpcAttribute takes one attribute per request, and DNS hostnames can only be on while
+    # DNS support is: enable support before hostnames, disable hostnames before support.
+    support = ("EnableDnsSupport", enable_dns_support)
+    hostnames = ("EnableDnsHostnames", enable_dns_hostnames)
+    ordered = [support, hostnames] if enable_dns_hostnames else [hostnames, support]
+    updates = [{name: {"Value": value}} for name, value in ordered if value is not None]
+    if enable_dns_support and enable_dns_hostnames is False:
+        # Turning support on and hostnames off cannot conflict in either order.
+        await asyncio.gather(*(_call(get_client("ec2").modify_vpc_attribute, VpcId=vpc_id, **update) for update in updates))
+    else:
+        for update in updates:
+            await _call(get_client("ec2").modify_vpc_attribute, VpcId=vpc_id, **update)
+    return [_json_content({"message": "VPC attributes updated", "vpc_id": vpc_id})]
+
+
+@aws_tool(server, "list_subnets", "List subnets optionally filtered by VPC")
 async def list_subnets(vpc_id: Optional[str] = None) -> List[Dict[str, Any]]:
-    try:
-        filters = [{"Name": "vpc-id", "Values": [vpc_id]}] if vpc_id else []
-        response = ec2_client.describe_subnets(Filters=filters)
-        return [_json_content(response.get("Subnets", []))]
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
-
-
-@server.tool("create_subnet", "Create a subnet within a VPC")
-async def create_subnet(vpc_id: str, cidr_block: str, availability_zone: Optional[str] = None) -> List[Dict[str, Any]]:
-    try:
-        params: Dict[str, Any] = {"VpcId": vpc_id, "CidrBlock": cidr_block}
-        if availability_zone:
-            params["AvailabilityZone"] = availability_zone
-        response = ec2_client.create_subnet(**params)
-        return [_json_content(response.get("Subnet", {}))]
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
-
-
-@server.tool("delete_subnet", "Delete a subnet")
+    subnets = await _cache.cached(f"list_subnets:{vpc_id or ''}", lambda: _fetch_subnets(vpc_id))
+    return [_json_content(subnets)]
+
+
+@aws_tool(server, "create_subnet", "Create a subnet within a VPC")
+async def create_subnet(vpc_id: str, cidr_block: str, availability_zone: Optional[str] = None, wait: bool = False) -> List[Dict[str, Any]]:
+    params: Dict[str, Any] = {"VpcId": vpc_id, "CidrBlock": cidr_block}
+    if availability_zone:
+        params["AvailabilityZone"] = availability_zone
+    response = await _call(get_client("ec2").create_subnet, **params)
+    subnet = response.get("Subnet", {})
+    _cache.invalidate_prefix("list_subnets:")
+    if wait:
+        try:
+            await _wait_for("subnet_available", SubnetIds=[subnet.get("SubnetId")])
+        except Exception as exc:  # noqa: BLE001
+            raise ToolError(f"Subnet {subnet.get('SubnetId')} was created, but did not become available: {exc}") from exc
+    return [_json_content(subnet)]
+
+
+@aws_tool(server, "delete_subnet", "Delete a subnet")
 async def delete_subnet(subnet_id: str) -> List[Dict[str, Any]]:
-    try:
-        response = ec2_client.delete_subnet(SubnetId=subnet_id)
-        return [_json_content(response or {"message": f"Subnet {subnet_id} deletion initiated"})]
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
+    response = await _call(get_client("ec2").delete_subnet, SubnetId=subnet_id)
+    _cache.invalidate_prefix("list_subnets:")
+    return [_json_content(response or {"message": f"Subnet {subnet_id} deletion initiated"})]
 
 
-@server.tool("create_tags", "Apply tags to AWS resources")
+@aws_tool(server, "create_tags", "Apply tags to AWS resources")
 async def create_tags(resource_ids: List[str], tags: Dict[str, str]) -> List[Dict[str, Any]]:
-    try:
-        tag_list = [{"Key": key, "Value": value} for key, value in tags.items()]
-        ec2_client.create_tags(Resources=resource_ids, Tags=tag_list)
-        return [_json_content({"message": "Tags applied", "resources": resource_ids})]
-    except Exception as exc:  # noqa: BLE001
-        raise _handle_boto_error(exc)
+    resource_ids = list(dict.fromkeys(resource_ids))
+    tag_list = [{"Key": key, "Value": value} for key, value in tags.items()]
+    results = await asyncio.gather(*(_call(get_client("ec2").create_tags, Resources=chunk, Tags=tag_list) for chunk in _chunks(resource_ids, _TAG_RESOURCES_PER_CALL)), return_exceptions=True)
+    # Chunks that succeeded changed their resources even if another failed, so evict before reporting.
+    _cache.clear()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return [_json_content({"message": "Tags applied", "resources": resource_ids})]
 
 
 async def main() -> None:
+    size_default_executor()
     await run(server)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main())
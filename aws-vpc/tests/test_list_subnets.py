@@ -0,0 +1,47 @@
+"""Tests for the VPC server's subnet listing."""
+import asyncio
+import base64
+import importlib.util
+from pathlib import Path
+
+import pytest
+from botocore.stub import Stubber
+
+_SERVER_PATH = Path(__file__).resolve().parent.parent / "server.py"
+
+
+@pytest.fixture
+def server():
+    spec = importlib.util.spec_from_file_location("aws_vpc_server", _SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def stubber(server, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with Stubber(server.get_client("ec2")) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_single_response_is_returned_without_paginating(server, stubber):
+    stubber.add_response("describe_subnets", {"Subnets": [{"SubnetId": "subnet-1"}]}, {"Filters": []})
+
+    (content,) = asyncio.run(server.list_subnets())
+
+    assert content["data"] == [{"SubnetId": "subnet-1"}]
+
+
+def test_truncated_response_resumes_from_the_service_token(server, stubber):
+    # A service token that happens to decode as JSON must still be sent back verbatim as NextToken.
+    token = base64.b64encode(b'{"v": "2", "c": "abc", "s": 1}').decode()
+    filters = [{"Name": "vpc-id", "Values": ["vpc-1"]}]
+    stubber.add_response("describe_subnets", {"Subnets": [{"SubnetId": "subnet-1"}], "NextToken": token}, {"Filters": filters})
+    stubber.add_response("describe_subnets", {"Subnets": [{"SubnetId": "subnet-2"}]}, {"Filters": filters, "NextToken": token})
+
+    (content,) = asyncio.run(server.list_subnets("vpc-1"))
+
+    assert content["data"] == [{"SubnetId": "subnet-1"}, {"SubnetId": "subnet-2"}]
@@ -0,0 +1,294 @@
+"""Shared session, client and response helpers for the AWS MCP servers."""
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+from cachetools import TTLCache
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional accelerator
+    orjson = None
+
+from mcp.server import ToolError
+
+# boto3 and botocore's client machinery are imported on first use, so the MCP
+# handshake is not held up by loading them. Set MCP_NO_DOTENV to skip .env parsing.
+if not os.getenv("MCP_NO_DOTENV"):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+AWS_PROFILE = os.getenv("AWS_PROFILE")
+
+MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+
+# Per-service adjustments on top of get_client_config(). EC2 control-plane replies are
+# small, so a read stalled on a kept-alive socket should fail over quickly instead of waiting 30s.
+_SERVICE_CONFIG: Dict[str, Dict[str, Any]] = {"ec2": {"read_timeout": 10}}
+
+CACHE_TTL = int(os.getenv("AWS_CACHE_TTL", "60"))
+
+# Parse large listings in worker processes instead of on the event loop's core.
+HEAVY_OFFLOAD = os.getenv("AWS_MCP_HEAVY_OFFLOAD") == "1"
+
+# Guards lazy session/client construction: tools first touch AWS from worker threads, and
+# lru_cache alone lets concurrent first calls each build their own session and pool.
+_client_lock = threading.RLock()
+_session: Any = None
+_clients: Dict[Tuple[str, Optional[str]], Any] = {}
+
+_JSON_TYPE = "application/json"
+_BOTO_ERRORS = (ClientError, BotoCoreError)
+
+
+@functools.lru_cache(maxsize=None)
+def get_client_config() -> Any:
+    """Return the tuned botocore ``Config`` shared by every client."""
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        # Adaptive mode rate-limits the client with a token bucket and retries throttles
+        # with jittered backoff; tool handlers should not wrap calls in retry loops of their own.
+        retries={"mode": "adaptive", "max_attempts": 8},
+        connect_timeout=3,
+        read_timeout=30,
+    )
+
+
+def get_session() -> Any:
+    global _session
+    if _session is None:
+        with _client_lock:
+            if _session is None:
+                import boto3
+
+                session_kwargs: Dict[str, Any] = {"region_name": AWS_REGION}
+                if AWS_PROFILE:
+                    session_kwargs["profile_name"] = AWS_PROFILE
+                _session = boto3.Session(**session_kwargs)
+    return _session
+
+
+def make_client(service_name: str, **config_overrides: Any) -> Any:
+    """Build a new client using the shared tuned config; prefer ``get_client`` in tools."""
+    from botocore.config import Config
+
+    config = get_client_config()
+    if config_overrides:
+        config = config.merge(Config(**config_overrides))
+    # boto3 sessions are not safe to build clients from concurrently.
+    with _client_lock:
+        return get_session().client(service_name, config=config)
+
+
+def get_client(service_name: str, region_name: Optional[str] = None) -> Any:
+    """Return the process-wide client for ``service_name``, created on first use.
+
+    Construction is deferred so a parent process that forks workers does not
+    hand them an already-open connection pool. ``region_name`` selects a
+    client for a region other than ``AWS_REGION``.
+    """
+    # Normalised so every call style for the default region shares one cache entry.
+    return _get_client(service_name, region_name or None)
+
+
+def _get_client(service_name: str, region_name: Optional[str]) -> Any:
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(key)
+            if client is None:
+                overrides = dict(_SERVICE_CONFIG.get(service_name, {}))
+                if region_name:
+                    overrides["region_name"] = region_name
+                client = _clients[key] = make_client(service_name, **overrides)
+    return client
+
+
+class ResponseCache(TTLCache):
+    """TTL cache for read-only tool results, keyed ``"<tool>:<args>"``."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = CACHE_TTL) -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl)
+
+    async def cached(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            pass
+        value = await fetch()
+        self[key] = value
+        return value
+
+    def invalidate_prefix(self, *prefixes: str) -> None:
+        for key in [key for key in self if key.startswith(prefixes)]:
+            self.pop(key, None)
+
+
+def _json_content(data: Any, _type: str = _JSON_TYPE) -> Dict[str, Any]:
+    # ``_type`` is bound at definition time so every tool response skips the global lookup.
+    return {"type": _type, "data": data}
+
+
+@functools.lru_cache(maxsize=256)
+def _message_content(message: str) -> Dict[str, Any]:
+    """Shared content item for fixed ``{"message": ...}`` responses; treat as read-only."""
+    return _json_content({"message": message})
+
+
+@functools.lru_cache(maxsize=256)
+def _filter(name: str, value: str) -> Tuple[Dict[str, Any], ...]:
+    """Interned single-value EC2 filter; pass ``list(_filter(...))`` as ``Filters`` and treat it as read-only."""
+    return ({"Name": name, "Values": [value]},)
+
+
+def _dumps(payload: Any) -> str:
+    """Serialize ``payload``, stringifying values JSON has no type for (e.g. datetimes in error responses)."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode()
+    return json.dumps(payload, default=str)
+
+
+def _loads(document: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(document)
+    return json.loads(document)
+
+
+def _handle_boto_error(error: Exception) -> ToolError:
+    # Tracebacks are only worth formatting when debugging; the error itself is enough otherwise.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.exception("AWS operation failed: %s", error)
+    else:
+        logger.error("AWS operation failed: %s", error)
+    if isinstance(error, _BOTO_ERRORS):
+        payload = getattr(error, "response", {"error": str(error)})
+        return ToolError(_dumps(payload))
+    return ToolError(str(error))
+
+
+def aws_tool(server: Any, name: str, description: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """Register the decorated handler on ``server``, converting AWS failures with ``_handle_boto_error``.
+
+    ``ToolError``s raised by the handler itself (e.g. not-found) pass through unchanged.
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return await func(*args, **kwargs)
+            except ToolError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                raise _handle_boto_error(exc)
+
+        server.tool(name, description)(wrapper)
+        return wrapper
+
+    return decorator
+
+
+async def _call(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking boto3 call on a worker thread so the event loop stays responsive."""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def size_default_executor() -> None:
+    """Give the running loop's default executor one thread per pooled connection.
+
+    ``_call`` runs on this executor, whose stock size (``cpu_count() + 4``)
+    would otherwise cap concurrent AWS calls below ``max_pool_connections``.
+    """
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=MAX_POOL_CONNECTIONS, thread_name_prefix="aws-call")
+    )
+
+
+def run_main(main: Awaitable[None]) -> None:
+    """Run a server's ``main()`` coroutine on uvloop when it is installed, else on the stock loop."""
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main)
+    else:
+        uvloop.run(main)
+
+
+@functools.lru_cache(maxsize=None)
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared worker pool, spawning (not forking) so workers start without inherited sockets."""
+    return ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+
+
+async def _run_in_process(func: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), func, *args)
+
+
+def _fetch_pages(service_name: str, operation: str, result_key: str, params: Dict[str, Any], region_name: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+    """Walk a paginated operation and return the ``result_key`` items of each page.
+
+    Runs on a worker thread via ``_paginate`` or inside the process pool,
+    where ``get_client`` resolves to the worker's own client.
+    """
+    paginator = get_client(service_name, region_name).get_paginator(operation)
+    return [page.get(result_key, []) for page in paginator.paginate(**params)]
+
+
+async def _paginate_regions(service_name: str, operation: str, result_key: str, regions: List[str], **params: Any) -> Dict[str, List[Dict[str, Any]]]:
+    """Walk a paginated operation in each of ``regions`` on the process pool and key the items by region.
+
+    Each worker parses its own responses, so large multi-region sweeps are not
+    bound by this process's GIL.
+    """
+    results = await asyncio.gather(*(_run_in_process(_fetch_pages, service_name, operation, result_key, params, region) for region in regions))
+    return {region: list(itertools.chain.from_iterable(pages)) for region, pages in zip(regions, results)}
+
+
+async def _paginate(service_name: str, operation: str, result_key: str, **params: Any) -> List[Dict[str, Any]]:
+    """Return every ``result_key`` item of a paginated operation, walked on a worker thread."""
+    pages = await _call(_fetch_pages, service_name, operation, result_key, params)
+    return list(itertools.chain.from_iterable(pages))
+
+
+def _fetch_items(service_name: str, operation: str, result_key: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Fetch ``result_key`` items in one unpaginated call, following ``NextToken`` only when AWS truncates.
+
+    The service's token is passed straight back with the original parameters;
+    a paginator's ``StartingToken`` expects botocore's own encoding instead.
+    Errors are not retried as a paginated walk because the same request would
+    fail again.
+    """
+    operation_call = getattr(get_client(service_name), operation)
+    response = operation_call(**params)
+    items = list(response.get(result_key, []))
+    while token := response.get("NextToken"):
+        response = operation_call(NextToken=token, **params)
+        items.extend(response.get(result_key, []))
+    return items
+
+
+async def _list_items(service_name: str, operation: str, result_key: str, **params: Any) -> List[Dict[str, Any]]:
+    """Run ``_fetch_items`` on a worker thread."""
+    return await _call(_fetch_items, service_name, operation, result_key, params)